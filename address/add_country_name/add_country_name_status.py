@@ -5,6 +5,7 @@ using data from countries_cache.json
 """
 
 import json
+import pickle
 import pymongo
 from pymongo import MongoClient
 import os
@@ -13,17 +14,58 @@ from dotenv import load_dotenv
 # Load environment variables
 load_dotenv()
 
+# Scratch collection holding the country cache during the server-side update
+COUNTRIES_TMP_COLLECTION = 'countries_tmp'
+
+COUNTRIES_CACHE_FILE = 'countries_cache.json'
+# Pickled copy of the parsed cache, reused while the JSON file is unchanged
+COUNTRIES_CACHE_PICKLE = 'countries_cache.pkl'
+
+def _load_pickled_cache(source_key):
+    """Return the pickled countries data if it was built from the current JSON file"""
+    try:
+        with open(COUNTRIES_CACHE_PICKLE, 'rb') as f:
+            cached = pickle.load(f)
+        if cached.get('source') == source_key:
+            return cached['data']
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, KeyError):
+        pass
+    return None
+
+def _save_pickled_cache(source_key, data):
+    """Store the parsed countries data next to the JSON file, ignoring write failures"""
+    try:
+        with open(COUNTRIES_CACHE_PICKLE, 'wb') as f:
+            pickle.dump({'source': source_key, 'data': data}, f, protocol=5)
+    except OSError:
+        pass
+
 def load_countries_cache():
     """Load countries data from cache file"""
     try:
-        with open('countries_cache.json', 'r', encoding='utf-8') as f:
-            return json.load(f)
+        stat = os.stat(COUNTRIES_CACHE_FILE)
+    except FileNotFoundError:
+        print("Error: countries_cache.json not found")
+        return None
+    
+    # Skip JSON parsing when the pickle matches the file's mtime and size
+    source_key = (stat.st_mtime_ns, stat.st_size)
+    data = _load_pickled_cache(source_key)
+    if data is not None:
+        return data
+    
+    try:
+        with open(COUNTRIES_CACHE_FILE, 'r', encoding='utf-8') as f:
+            data = json.load(f)
     except FileNotFoundError:
         print("Error: countries_cache.json not found")
         return None
     except json.JSONDecodeError as e:
         print(f"Error parsing JSON: {e}")
         return None
+    
+    _save_pickled_cache(source_key, data)
+    return data
 
 def connect_to_mongodb():
     """Connect to MongoDB database"""
@@ -50,42 +92,59 @@ def update_country_names(collection, countries_data):
     
     print("Starting country name updates for country_status collection...")
     
-    # Get all documents from the collection
-    documents = list(collection.find({}))
-    print(f"Found {len(documents)} documents in country_status collection")
+    db = collection.database
+    tmp_collection = db[COUNTRIES_TMP_COLLECTION]
+    country_codes = list(countries_data.keys())
     
-    updated_count = 0
-    not_found_countries = []
+    # Count what will be touched before the merge rewrites the collection; a null or
+    # empty country_code counts as missing, as does an absent field
+    missing_code_count = collection.count_documents({"country_code": {"$in": [None, ""]}})
+    if missing_code_count:
+        print(f"Warning: {missing_code_count} documents have no country_code field")
     
-    for doc in documents:
-        country_code = doc.get('country_code')
+    not_found_countries = collection.distinct(
+        "country_code", {"country_code": {"$nin": country_codes + [None, ""]}}
+    )
+    
+    # Join each document to its cached country name
+    lookup_stages = [
+        {"$lookup": {
+            "from": COUNTRIES_TMP_COLLECTION,
+            "localField": "country_code",
+            "foreignField": "_id",
+            "as": "c"
+        }},
+        {"$match": {"c.0": {"$exists": True}}},
+    ]
+    
+    try:
+        # Upload the cache once so the join runs entirely on the server
+        tmp_collection.drop()
+        tmp_collection.insert_many([
+            {"_id": code, "country_name": data['name']}
+            for code, data in countries_data.items()
+        ])
         
-        if not country_code:
-            print(f"Warning: Document {doc['_id']} has no country_code field")
-            continue
-            
-        if country_code in countries_data:
-            country_name = countries_data[country_code]['name']
-            
-            # Update this specific document
-            result = collection.update_one(
-                {"_id": doc["_id"]},
-                {"$set": {"country_name": country_name}}
-            )
-            
-            if result.modified_count > 0:
-                updated_count += 1
-                print(f"Updated document for {country_code} ({country_name}) - Status: {doc.get('status', 'N/A')}")
-            
-        else:
-            not_found_countries.append(country_code)
-            print(f"Warning: Country code '{country_code}' not found in cache")
+        # Only documents whose country_name actually changes count as updated
+        changed = list(collection.aggregate(lookup_stages + [
+            {"$match": {"$expr": {"$ne": ["$country_name", {"$arrayElemAt": ["$c.country_name", 0]}]}}},
+            {"$count": "count"}
+        ]))
+        updated_count = changed[0]['count'] if changed else 0
+        
+        collection.aggregate(lookup_stages + [
+            {"$set": {"country_name": {"$arrayElemAt": ["$c.country_name", 0]}}},
+            {"$project": {"_id": 1, "country_name": 1}},
+            {"$merge": {"into": collection.name, "whenMatched": "merge", "whenNotMatched": "discard"}}
+        ])
+    finally:
+        tmp_collection.drop()
     
     print(f"\nUpdate completed!")
     print(f"Total documents updated: {updated_count}")
     
     if not_found_countries:
-        print(f"Countries not found in cache: {list(set(not_found_countries))}")
+        print(f"Countries not found in cache: {not_found_countries}")
     
     return updated_count
 
@@ -115,12 +174,32 @@ def analyze_collection(collection):
     """Analyze the current state of the collection"""
     print("\n=== Country Status Collection Analysis ===")
     
-    # Total document count
-    total_docs = collection.count_documents({})
+    # Totals, status distribution and the listing in one round trip
+    pipeline = [
+        {"$facet": {
+            "total": [{"$count": "count"}],
+            "with_name": [
+                {"$match": {"country_name": {"$exists": True}}},
+                {"$count": "count"}
+            ],
+            "status_dist": [
+                {"$group": {"_id": "$status", "count": {"$sum": 1}}},
+                {"$sort": {"count": -1}}
+            ],
+            "listing": [
+                {"$sort": {"country_code": 1}},
+                {"$project": {"_id": 0, "country_code": 1, "country_name": 1, "status": 1}}
+            ]
+        }}
+    ]
+    facets = next(collection.aggregate(pipeline))
+    
+    # $count emits no document for an empty input
+    total_docs = facets['total'][0]['count'] if facets['total'] else 0
     print(f"Total documents: {total_docs}")
     
     # Check if country_name field exists
-    with_country_name = collection.count_documents({"country_name": {"$exists": True}})
+    with_country_name = facets['with_name'][0]['count'] if facets['with_name'] else 0
     without_country_name = total_docs - with_country_name
     
     print(f"Documents with country_name: {with_country_name}")
@@ -128,19 +207,12 @@ def analyze_collection(collection):
     
     # Status distribution
     print("\n=== Status Distribution ===")
-    pipeline = [
-        {"$group": {"_id": "$status", "count": {"$sum": 1}}},
-        {"$sort": {"count": -1}}
-    ]
-    
-    status_dist = list(collection.aggregate(pipeline))
-    for status in status_dist:
+    for status in facets['status_dist']:
         print(f"{status['_id']}: {status['count']} countries")
     
     # Show all countries
     print("\n=== All Countries ===")
-    all_docs = collection.find({}).sort("country_code", 1)
-    for doc in all_docs:
+    for doc in facets['listing']:
         country_name = doc.get('country_name', 'NOT SET')
         print(f"{doc['country_code']}: {country_name} | Status: {doc.get('status', 'N/A')}")
 
@@ -1,10 +1,23 @@
 import geonamescache
+import logging
+import re
+from bisect import bisect_left
+from functools import lru_cache
+import sys
 import time
+from types import MappingProxyType
+
+# Diagnostics go through logging so they stay silent unless a caller opts in
+logger = logging.getLogger(__name__)
 
 _geonames_cache = None
 _cities_data = None
 _countries_data = None
-COUNTRY_MAPPING = {
+_country_name_to_code = None  # lowercased country name -> country code
+_cities_by_country = None  # country code -> frozenset of lowercased city names
+_city_names_sorted_by_country = None  # country code -> sorted lowercased city names, for prefix search
+_city_names_blob_by_country = None  # country code -> newline-joined lowercased city names, for substring search
+_COUNTRY_ALIASES = {
     # Korea variations
     "korea, south": "south korea",
     "korea, north": "north korea",
@@ -44,20 +57,64 @@ COUNTRY_MAPPING = {
     "u.s.": "united states",
     "u.k.": "united kingdom",
 }
+# Read-only alias -> normalized name mapping; normalized names also map to themselves.
+# Keys and values are interned so each normalized name is one shared object
+COUNTRY_MAPPING = MappingProxyType({
+    sys.intern(key): sys.intern(value)
+    for key, value in {
+        **{name: name for name in set(_COUNTRY_ALIASES.values())},
+        **_COUNTRY_ALIASES,
+    }.items()
+})
+_COUNTRY_ALIAS_KEYS = frozenset(_COUNTRY_ALIASES)
+# Final segments of the comma-containing aliases ("south" for "korea, south"); a two-part
+# country can only be present when the address ends in one of these
+_TWO_PART_ALIAS_TAILS = frozenset(
+    alias.rpartition(", ")[2] for alias in _COUNTRY_ALIAS_KEYS if ", " in alias
+)
 def get_geonames_data():
     """Get cached geonames data, loading it only once."""
-    global _geonames_cache, _cities_data, _countries_data
+    global _geonames_cache, _cities_data, _countries_data, _country_name_to_code, _cities_by_country
+    global _city_names_sorted_by_country, _city_names_blob_by_country
     
     if _geonames_cache is None:
-        print("Loading geonames data for the first time...")
+        logger.info("Loading geonames data for the first time...")
         start_time = time.time()
         _geonames_cache = geonamescache.GeonamesCache()
         _cities_data = _geonames_cache.get_cities()
         _countries_data = _geonames_cache.get_countries()
+        
+        # Lookup tables so city_in_country avoids scanning every country and city
+        _country_name_to_code = {}
+        for code, data in _countries_data.items():
+            _country_name_to_code.setdefault(data.get('name', '').lower().strip(), code)
+        
+        _cities_by_country = {}
+        for city_data in _cities_data.values():
+            _cities_by_country.setdefault(city_data.get("countrycode", ""), set()).add(
+                city_data.get("name", "").lower()
+            )
+        # Freeze the per-country indexes into compact read-only containers
+        _cities_by_country = {
+            code: frozenset(names) for code, names in _cities_by_country.items()
+        }
+        _city_names_sorted_by_country = {
+            code: tuple(sorted(names)) for code, names in _cities_by_country.items()
+        }
+        _city_names_blob_by_country = {
+            code: "\n".join(names) for code, names in _city_names_sorted_by_country.items()
+        }
         end_time = time.time()
-        print(f"Geonames data loaded in {end_time - start_time:.2f} seconds")
+        logger.info("Geonames data loaded in %.2f seconds", end_time - start_time)
     
     return _cities_data, _countries_data
+# Western Sahara cities
+WESTERN_SAHARA_CITIES = [
+    "laayoune", "dakhla", "boujdour", "es semara", "sahrawi", "tifariti", "aousserd"
+]
+# Single alternation so the address is scanned once rather than once per city
+_WESTERN_SAHARA_RE = re.compile("|".join(map(re.escape, WESTERN_SAHARA_CITIES)))
+
 def check_western_sahara_cities(generated_address: str) -> bool:
     """
     Check if any Western Sahara city appears in the generated address.
@@ -71,19 +128,62 @@ def check_western_sahara_cities(generated_address: str) -> bool:
     if not generated_address:
         return False
     
-    # Western Sahara cities
-    WESTERN_SAHARA_CITIES = [
-        "laayoune", "dakhla", "boujdour", "es semara", "sahrawi", "tifariti", "aousserd"
-    ]
-    
     gen_lower = generated_address.lower()
     
     # Check if any of the cities appear in the generated address
-    for city in WESTERN_SAHARA_CITIES:
-        if city in gen_lower:
-            return True
+    return _WESTERN_SAHARA_RE.search(gen_lower) is not None
+
+
+def _determine_country(head: str, last_part: str, two_parts: bool) -> tuple:
+    """
+    Determine the country from an address split at its last comma.
+    
+    Args:
+        head: Everything before the last comma, in its original case
+        last_part: The stripped, lowercased segment after the last comma
+        two_parts: Same meaning as in extract_city_country
+
+    Returns:
+        Tuple of (country_checking_name, normalized_country, remainder) where remainder
+        is the part of the address before the segment(s) used for the country
+    """
+    # The country_checking_name is used for geonames lookups
+    # The normalized_country is what we return
     
-    return False
+    # If two_parts flag is set, try the two-part country first, peeling one more segment
+    if two_parts and last_part in _TWO_PART_ALIAS_TAILS:
+        rest, _, second_last = head.rpartition(",")
+        two_part_raw = f"{second_last.strip().lower()}, {last_part}"
+
+        if two_part_raw in _COUNTRY_ALIAS_KEYS:
+            two_part_normalized = COUNTRY_MAPPING[two_part_raw]
+            return two_part_normalized, two_part_normalized, rest
+
+    # Single-part country (just the last segment)
+    single_part_normalized = COUNTRY_MAPPING.get(last_part, last_part)
+    return single_part_normalized, single_part_normalized, head
+
+
+def extract_country_only(address: str, two_parts: bool = False) -> str:
+    """
+    Extract only the normalized country from an address, skipping the city search.
+    
+    Args:
+        address: The address to extract from
+        two_parts: Same meaning as in extract_city_country
+
+    Returns:
+        The normalized country, or an empty string if not found
+    """
+    if not address:
+        return ""
+
+    # Only the last one or two segments matter, so avoid splitting the whole address
+    head, sep, last_part = address.rpartition(",")
+    if not sep:
+        return ""
+
+    return _determine_country(head, last_part.strip().lower(), two_parts)[1]
 
 
 def extract_city_country(address: str, two_parts: bool = False) -> tuple:
@@ -112,79 +212,84 @@ def extract_city_country(address: str, two_parts: bool = False) -> tuple:
     if not address:
         return "", ""
 
-    address = address.lower()
-    
-    parts = [p.strip() for p in address.split(",")]
-    if len(parts) < 2:
+    # Only the country segment is lowercased up front; the rest waits until the
+    # country is known to be in geonames
+    head, sep, last_part = address.rpartition(",")
+    if not sep:
         return "", ""
 
-    # Determine country and its normalized form
-    # The country_checking_name is used for geonames lookups
-    # The normalized_country is what we return
-    
-    # Always try single-part country first (just the last segment)
-    last_part = parts[-1]
-    single_part_normalized = COUNTRY_MAPPING.get(last_part, last_part)
-    
-    # If two_parts flag is set, also try two-part country
-    country_checking_name = ''
-    if two_parts and len(parts) >= 2:
-        two_part_raw = f"{parts[-2]}, {parts[-1]}"
-        two_part_normalized = COUNTRY_MAPPING.get(two_part_raw, two_part_raw)
-
-        if two_part_raw != two_part_normalized:
-            country_checking_name = two_part_normalized
-            normalized_country = two_part_normalized
-            used_two_parts_for_country = True
-
-    if country_checking_name == '':
-        # Single-part country
-        country_checking_name = single_part_normalized
-        normalized_country = single_part_normalized
-        used_two_parts_for_country = False
+    country_checking_name, normalized_country, remainder = _determine_country(head, last_part.strip().lower(), two_parts)
 
     # If no country found, return empty
     if not normalized_country:
         return "", ""
 
-    # Check each section from right to left (excluding the country)
-    exclude_count = 2 if used_two_parts_for_country else 1
-    # Start from 2 when excluding one part (country), 3 when excluding two parts
-    for i in range(exclude_count + 1, len(parts) + 1):
-        candidate_index = -i
-        if abs(candidate_index) > len(parts):
-            break
-        
-        candidate_part = parts[candidate_index]
+    # Resolve the country once instead of per candidate
+    country_code = _country_name_to_code.get(country_checking_name.strip())
+    if not country_code:
+        return "", normalized_country
+    city_names = _cities_by_country.get(country_code, frozenset())
+
+    # Tokenize every section right to left (excluding the country) into one flat,
+    # ordered candidate list: each word, then the word joined with the one before it
+    candidates = []
+    for candidate_part in reversed(remainder.lower().split(",")):
+        candidate_part = candidate_part.strip()
         if not candidate_part:
             continue
-            
         words = candidate_part.split()
-        
-        # Try different combinations of words (1-2 words max)
-        # Start with 2 words, then 1 word for better city matching
-        for num_words in range(len(words)):
-            current_word = words[num_words]
-
-            # Try current word
-            candidates = [current_word]
-
-            # Also try current + previous (if exists)
+        for num_words, current_word in enumerate(words):
+            candidates.append(current_word)
             if num_words > 0:
-                prev_plus_current = words[num_words - 1] + " " + words[num_words]
-                candidates.append(prev_plus_current)
+                candidates.append(words[num_words - 1] + " " + current_word)
 
-            for city_candidate in candidates:
-                # Skip if contains numbers or is too short
-                if any(char.isdigit() for char in city_candidate):
-                    continue
+    for city_candidate in candidates:
+        if " " not in city_candidate:
+            # A single word can only match a name exactly, so the set probe rejects
+            # almost every candidate and the digit check only runs on the rare hit
+            if city_candidate in city_names and not any(map(str.isdigit, city_candidate)):
+                return city_candidate, normalized_country
+            continue
 
-                # Validate the city exists in the country
-                if city_in_country(city_candidate, country_checking_name):
-                    return city_candidate, normalized_country
+        # Skip if contains numbers
+        if any(map(str.isdigit, city_candidate)):
+            continue
+
+        # Two-word candidates may also match on the prefix/substring checks
+        if _city_in_country_code(city_candidate, country_code):
+            return city_candidate, normalized_country
 
     return "", normalized_country
 
+@lru_cache(maxsize=65536)
+def _city_in_country_code(city_name_lower: str, country_code: str) -> bool:
+    """
+    Check an already-lowercased city name against the cities of one country code.
+    
+    Memoized per (name, code) because a miss scans the country's name blob; the geonames
+    data is loaded once at import, so call cache_clear() if it is ever rebuilt.
+    """
+    # Only check cities that are actually in the specified country
+    city_names = _cities_by_country.get(country_code, ())
+    
+    # Check exact match first
+    if city_name_lower.strip() in city_names:
+        return True
+    
+    city_words = city_name_lower.split()
+    if len(city_words) < 2:
+        return False
+    
+    # Check first word match: any city name starting with it sorts at or right after it
+    sorted_names = _city_names_sorted_by_country.get(country_code, ())
+    index = bisect_left(sorted_names, city_words[0])
+    if index < len(sorted_names) and sorted_names[index].startswith(city_words[0]):
+        return True
+    
+    # Check second word match: words never contain newlines, so a hit is inside one name
+    return city_words[1] in _city_names_blob_by_country.get(country_code, "")
+
+
 def city_in_country(city_name: str, country_name: str) -> bool:
     """
     Check if a city is actually in the specified country using geonamescache.
@@ -200,45 +305,18 @@ def city_in_country(city_name: str, country_name: str) -> bool:
         return False
     
     try:
-        cities, countries = get_geonames_data()
-        
+        # Geonames names were lowercased once at load time; only the inputs need it here
         city_name_lower = city_name.lower()
-        country_name_lower = country_name.lower()
         
         # Find country code
-        country_code = None
-        for code, data in countries.items():
-            if data.get('name', '').lower().strip() == country_name_lower.strip():
-                country_code = code
-                break
-        
+        country_code = _country_name_to_code.get(country_name.lower().strip())
         if not country_code:
             return False
         
-        # Only check cities that are actually in the specified country
-        city_words = city_name_lower.split()
-        
-        for city_id, city_data in cities.items():
-            # Skip cities not in the target country
-            if city_data.get("countrycode", "") != country_code:
-                continue
-                
-            city_data_name = city_data.get("name", "").lower()
-            
-            # Check exact match first
-            if city_data_name.strip() == city_name_lower.strip():
-                return True
-            # Check first word match
-            elif len(city_words) >= 2 and city_data_name.startswith(city_words[0]):
-                return True
-            # Check second word match
-            elif len(city_words) >= 2 and city_words[1] in city_data_name:
-                return True
-        
-        return False
+        return _city_in_country_code(city_name_lower, country_code)
         
     except Exception as e:
-        print(f"Error checking city '{city_name}' in country '{country_name}': {str(e)}")
+        logger.debug("Error checking city '%s' in country '%s': %s", city_name, country_name, e)
         return False
 
 
@@ -273,26 +351,40 @@ def validate_address_region(generated_address: str, seed_address: str) -> bool:
         gen_lower = generated_address.lower()
         return seed_lower in gen_lower
     
+    two_parts = ',' in seed_address
+    seed_mapped = COUNTRY_MAPPING.get(seed_lower, seed_lower)
+    
+    # Cheap country-only pass first: with no country there can be no city either
+    gen_country = extract_country_only(generated_address, two_parts=two_parts)
+    if not gen_country:
+        logger.debug("-------city")
+        return False
+    
+    # If the country does not match, only a city equal to the seed can pass, and its
+    # words must then appear in the address; skip the city search when they don't
+    if gen_country != seed_lower and gen_country != seed_mapped:
+        gen_lower = generated_address.lower()
+        if not all(word in gen_lower for word in seed_lower.split()):
+            return False
+    
     # Extract city and country from both addresses
-    gen_city, gen_country = extract_city_country(generated_address, two_parts=(',' in seed_address))
-    seed_address_lower = seed_address.lower()
-    seed_address_mapped = COUNTRY_MAPPING.get(seed_address.lower(), seed_address.lower())
+    gen_city, gen_country = extract_city_country(generated_address, two_parts=two_parts)
 
     
     # If no city was extracted from generated address, it's an error
     if not gen_city:
-        print("-------city")
+        logger.debug("-------city")
         return False
     
     # If no country was extracted from generated address, it's an error
     if not gen_country:
-        print("-------country")
+        logger.debug("-------country")
         return False
     
-    # Check if either city or country matches
-    city_match = gen_city and seed_address_lower and gen_city == seed_address_lower
-    country_match = gen_country and seed_address_lower and gen_country == seed_address_lower
-    mapped_match = gen_country and seed_address_mapped and gen_country == seed_address_mapped
+    # Check if either city or country matches; all of these are non-empty by now
+    city_match = gen_city == seed_lower
+    country_match = gen_country == seed_lower
+    mapped_match = gen_country == seed_mapped
 
     
     if not (city_match or country_match or mapped_match):
@@ -300,5 +392,8 @@ def validate_address_region(generated_address: str, seed_address: str) -> bool:
     
     return True
 
+# Build the geonames indexes once at import so the lookups above read them directly
+get_geonames_data()
+
 if __name__ == "__main__":
     print(validate_address_region("Gich Binka, 164 кӯчаи С. Абдураҳмонов, Khorog, 736000, Afghanistan", "Afghanistan"))
\ No newline at end of file